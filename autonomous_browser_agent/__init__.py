@@ -6,7 +6,8 @@ and interact with any website based on natural language instructions.
 """
 
 from autonomous_browser_agent.agent import AutonomousBrowserAgent, browse_website, browse_website_cli
+from autonomous_browser_agent.watchdog import ResourceWatchdog, cleanup_orphaned_browsers, tag_browser_owner
 
-__all__ = ["AutonomousBrowserAgent", "browse_website", "browse_website_cli"]
+__all__ = ["AutonomousBrowserAgent", "browse_website", "browse_website_cli", "ResourceWatchdog", "cleanup_orphaned_browsers", "tag_browser_owner"]
 
 __version__ = "0.1.0" 
\ No newline at end of file
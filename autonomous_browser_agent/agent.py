@@ -3,9 +3,12 @@ import os
 import logging
 import argparse
 import traceback
+from typing import Callable, Optional
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
-from browser_use import Agent, Browser, BrowserConfig, BrowserContextConfig
+from browser_use import ActionResult, Agent, Browser, BrowserConfig, BrowserContextConfig
+from autonomous_browser_agent.dom_cache import CachingBrowserContext
+from autonomous_browser_agent.watchdog import ResourceWatchdog
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -21,6 +24,43 @@ BROWSER_SIZES = {
     "pc": {"width": 1366, "height": 768}
 }
 
+class _SteppedAgent(Agent):
+    """
+    browser-use Agent that awaits a hook before each step, while the browser is idle.
+    
+    The hook receives the number of the step about to run. A string it returns
+    is added to the previous step's results, so the model sees it together with
+    the next page state.
+    """
+    
+    def __init__(self, *args, before_step=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.before_step = before_step
+    
+    @property
+    def step_number(self):
+        # browser-use 0.1.40 moved the step counter into AgentState
+        state = getattr(self, 'state', None)
+        if state is not None and hasattr(state, 'n_steps'):
+            return state.n_steps
+        return self.n_steps
+    
+    async def step(self, step_info=None):
+        if self.before_step is not None:
+            note = await self.before_step(self.step_number)
+            if note:
+                self._add_note(note)
+        return await super().step(step_info)
+    
+    def _add_note(self, note):
+        result = ActionResult(extracted_content=note, include_in_memory=True)
+        # browser-use 0.1.40 moved the previous results into AgentState
+        state = getattr(self, 'state', None)
+        if state is not None and hasattr(state, 'last_result'):
+            state.last_result = (state.last_result or []) + [result]
+        else:
+            self._last_result = (self._last_result or []) + [result]
+
 class AutonomousBrowserAgent:
     """
     A browser agent that can autonomously browse any website based on instructions.
@@ -37,7 +77,11 @@ class AutonomousBrowserAgent:
         max_steps: int = 50,
         use_vision: bool = True,
         generate_gif: bool = False,
-        browser_size: str = "mobile"
+        browser_size: str = "mobile",
+        dom_cache: bool = True,
+        watchdog: Optional[ResourceWatchdog] = None,
+        on_event: Optional[Callable[[str, dict], None]] = None,
+        on_step: Optional[Callable[[int], None]] = None
     ):
         """
         Initialize the autonomous browser agent.
@@ -50,6 +94,10 @@ class AutonomousBrowserAgent:
             use_vision (bool): Whether to use vision capabilities for better understanding web content
             generate_gif (bool): Whether to generate a GIF of the browsing session
             browser_size (str): Size of the browser window ('mobile', 'tablet', or 'pc')
+            dom_cache (bool): Whether to reuse DOM extractions while the page is unchanged
+            watchdog (ResourceWatchdog): Optional watchdog that monitors and recycles the browser during the run
+            on_event (callable): Optional callback receiving (message, details) for structured run events
+            on_step (callable): Optional callback receiving the step number before each agent step
         """
         logger.info("Starting AutonomousBrowserAgent initialization")
         
@@ -64,6 +112,10 @@ class AutonomousBrowserAgent:
         self.max_steps = max_steps
         self.use_vision = use_vision
         self.generate_gif = generate_gif
+        self.dom_cache = dom_cache
+        self.watchdog = watchdog
+        self.on_event = on_event
+        self.on_step = on_step
         
         # Set browser size dimensions
         if browser_size not in BROWSER_SIZES:
@@ -91,16 +143,25 @@ class AutonomousBrowserAgent:
         # Initialize the browser with enhanced timeout and navigation settings
         logger.info("Initializing browser")
         try:
+            context_config = BrowserContextConfig(
+                disable_security=True,
+                browser_window_size=window_size,
+            )
             self.browser = Browser(
                 config=BrowserConfig(
                     headless=self.headless,
                     disable_security=True,
-                    new_context_config=BrowserContextConfig(
-                        disable_security=True,
-                        browser_window_size=window_size,
-                    ),
+                    new_context_config=context_config,
+                    # Lets the watchdog find this agent's browser among others
+                    extra_chromium_args=self.watchdog.browser_args() if self.watchdog is not None else [],
                 )
             )
+            self.browser_context = CachingBrowserContext(
+                browser=self.browser,
+                config=context_config,
+                enabled=self.dom_cache,
+            )
+            logger.info(f"DOM extraction cache {'enabled' if self.dom_cache else 'disabled'}")
             logger.info("Browser initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing browser: {str(e)}")
@@ -110,12 +171,14 @@ class AutonomousBrowserAgent:
         # Initialize the agent with additional settings
         logger.info("Initializing agent")
         try:
-            self.agent = Agent(
+            self.agent = _SteppedAgent(
                 task=self.instruction,
                 llm=self.llm,
                 browser=self.browser,
+                browser_context=self.browser_context,
                 use_vision=self.use_vision,
-                generate_gif=self.generate_gif
+                generate_gif=self.generate_gif,
+                before_step=self._before_step
             )
             logger.info("Agent initialized successfully")
         except Exception as e:
@@ -124,12 +187,18 @@ class AutonomousBrowserAgent:
             raise
         
         self.history = None
+        self.browser_killed_reason = None
+        self._run_task = None
         logger.info("AutonomousBrowserAgent initialization completed")
         
     async def run(self):
         """Run the browser agent to complete the given instruction."""
         logger.info(f"Starting autonomous browser agent with instruction: {self.instruction}")
-        logger.info(f"Configuration: model={self.model}, headless={self.headless}, max_steps={self.max_steps}, use_vision={self.use_vision}, generate_gif={self.generate_gif}, browser_size={self.browser_size}")
+        logger.info(f"Configuration: model={self.model}, headless={self.headless}, max_steps={self.max_steps}, use_vision={self.use_vision}, generate_gif={self.generate_gif}, browser_size={self.browser_size}, dom_cache={self.dom_cache}")
+        
+        if self.watchdog is not None:
+            logger.info("Starting resource watchdog")
+            self.watchdog.start(on_kill=self._on_browser_killed)
         
         try:
             # Ensure browser is ready by navigating to a simple test page first
@@ -150,11 +219,18 @@ class AutonomousBrowserAgent:
             
             try:
                 # Run the agent with a timeout to prevent hanging
-                self.history = await asyncio.wait_for(run_with_timeout(), timeout=300)  # 5 minute timeout
+                self._run_task = asyncio.ensure_future(run_with_timeout())
+                self.history = await asyncio.wait_for(self._run_task, timeout=300)  # 5 minute timeout
                 logger.info("Agent run completed successfully")
             except asyncio.TimeoutError:
                 logger.error("Agent execution timed out after 5 minutes")
                 return "Agent execution timed out. The browser agent was unable to complete the task within the allocated time."
+            except asyncio.CancelledError:
+                # Only swallow the cancellation issued by _on_browser_killed
+                if self.browser_killed_reason is None:
+                    raise
+                logger.error(f"Agent run stopped because the browser was killed: {self.browser_killed_reason}")
+                return f"Agent execution stopped: browser killed by resource watchdog ({self.browser_killed_reason})"
             except Exception as e:
                 logger.error(f"Error during agent.run(): {str(e)}")
                 logger.error(f"Stack trace: {traceback.format_exc()}")
@@ -204,11 +280,156 @@ class AutonomousBrowserAgent:
             logger.error(f"Stack trace: {traceback.format_exc()}")
             return f"An error occurred while running the browser agent: {str(e)}"
         finally:
+            self._run_task = None
+            if self.watchdog is not None:
+                await self.watchdog.stop()
+                logger.info(f"Resource watchdog stopped after {self.watchdog.recycles} recycles and {self.watchdog.kills} kills")
+            
+            if self.dom_cache:
+                stats = self.browser_context.dom_cache_stats
+                logger.info(
+                    f"DOM cache: {stats.hits} hits, {stats.misses} misses, {stats.bypassed} bypassed "
+                    f"(hit rate {stats.hit_rate:.0%}), {stats.saved_seconds:.2f}s of extraction saved"
+                )
+                if self.on_event is not None:
+                    try:
+                        self.on_event("DOM cache stats", {"event": "dom_cache_stats", **stats.as_dict()})
+                    except Exception as e:
+                        logger.error(f"Error reporting DOM cache stats: {str(e)}")
+            
             # Cleanup resources
             logger.info("Starting cleanup")
             await self.cleanup()
             logger.info("Cleanup completed")
     
+    async def _before_step(self, step_number):
+        """
+        Report the step that is about to run and carry out a recycle requested
+        by the watchdog, between two agent steps.
+        
+        Args:
+            step_number (int): The number of the step about to run
+            
+        Returns:
+            str: A note for the agent about the restarted browser, or None
+        """
+        if self.on_step is not None:
+            try:
+                self.on_step(step_number)
+            except Exception as e:
+                logger.error(f"Error reporting step {step_number}: {str(e)}")
+        
+        if self.watchdog is None:
+            return None
+        reason = self.watchdog.take_recycle_request()
+        if reason is None:
+            return None
+        logger.warning(f"Recycling browser: {reason}")
+        try:
+            summary = await self.recycle_browser()
+        except Exception as e:
+            # The watchdog kills the browser if it stays over its limits
+            logger.error(f"Error recycling browser: {str(e)}")
+            logger.error(f"Stack trace: {traceback.format_exc()}")
+            self._emit_event("Browser recycle failed", {"event": "browser_recycle_failed", "reason": reason, "error": str(e)})
+            return f"The browser was restarted to free resources but could not be fully restored ({str(e)}). Check the current page and whether you are still logged in before continuing."
+        
+        self._emit_event("Browser recycled", {"event": "browser_recycled", "reason": reason, **summary})
+        note = f"The browser was restarted to free resources and {summary['url'] or 'a blank page'} was reopened. "
+        if summary["session_captured"]:
+            note += (
+                f"{summary['cookies_restored']} cookies and {summary['local_storage_restored']} localStorage items were restored; "
+                "sessionStorage, open tabs and unsaved form input were lost."
+            )
+        else:
+            note += "Cookies and storage could not be saved, so any login session was lost."
+        if summary["local_storage_lost_origins"]:
+            note += f" localStorage was lost for {', '.join(summary['local_storage_lost_origins'])}."
+        return note
+    
+    def _emit_event(self, message, details):
+        if self.on_event is None:
+            return
+        try:
+            self.on_event(message, details)
+        except Exception as e:
+            logger.error(f"Error reporting event {details.get('event')}: {str(e)}")
+    
+    def _on_browser_killed(self, reason):
+        """Stop the run once the watchdog has killed the browser it depends on."""
+        self.browser_killed_reason = reason
+        if self._run_task is not None and not self._run_task.done():
+            self._run_task.cancel()
+    
+    async def recycle_browser(self) -> dict:
+        """
+        Replace the running browser with a fresh one and reopen the current page.
+        
+        browser-use relaunches the browser and context on their next use once
+        they have been closed, so the agent keeps running on the new browser.
+        Cookies and the current page's localStorage are carried over; other
+        origins' localStorage and all sessionStorage are lost. Must only be
+        called while no agent step is using the browser.
+        
+        Returns:
+            dict: What was restored and what was lost, for reporting
+        """
+        context = self.browser_context
+        url = None
+        storage = None
+        try:
+            session = await context.get_session()
+            page = await context.get_current_page()
+            url = page.url
+            storage = await session.context.storage_state()
+        except Exception as e:
+            logger.warning(f"Could not capture session state before recycling: {str(e)}")
+        
+        logger.info("Closing browser for recycling")
+        await context.close()
+        await self.browser.close()
+        context.dom_cache.clear()
+        
+        summary = {
+            "url": url,
+            "session_captured": storage is not None,
+            "cookies_restored": 0,
+            "local_storage_restored": 0,
+            "local_storage_lost_origins": [],
+        }
+        storage = storage or {"cookies": [], "origins": []}
+        session = await context.get_session()
+        if storage["cookies"]:
+            await session.context.add_cookies(storage["cookies"])
+            summary["cookies_restored"] = len(storage["cookies"])
+        
+        origin = None
+        if url and url.startswith("http"):
+            logger.info(f"Reopening {url} in recycled browser")
+            page = await context.get_current_page()
+            await page.goto(url)
+            await page.wait_for_load_state()
+            origin = await page.evaluate("location.origin")
+            
+            # localStorage can only be written from a page on its own origin
+            for entry in storage["origins"]:
+                if entry["origin"] != origin or not entry["localStorage"]:
+                    continue
+                await page.evaluate(
+                    "items => { for (const { name, value } of items) localStorage.setItem(name, value); }",
+                    entry["localStorage"]
+                )
+                summary["local_storage_restored"] = len(entry["localStorage"])
+                await page.reload()
+                await page.wait_for_load_state()
+        
+        summary["local_storage_lost_origins"] = [
+            entry["origin"] for entry in storage["origins"]
+            if entry["origin"] != origin and entry["localStorage"]
+        ]
+        logger.info(f"Browser recycled successfully: {summary}")
+        return summary
+    
     async def cleanup(self):
         """Clean up browser resources."""
         try:
@@ -224,8 +445,29 @@ class AutonomousBrowserAgent:
         except Exception as e:
             logger.error(f"Error during cleanup: {e}")
             logger.error(f"Stack trace: {traceback.format_exc()}")
+        
+        # The agent doesn't close a browser or context it was handed
+        try:
+            await self.browser_context.close()
+            logger.info("Browser context closed successfully")
+        except Exception as e:
+            logger.error(f"Error closing browser context: {e}")
+        try:
+            await self.browser.close()
+            logger.info("Browser closed successfully")
+        except Exception as e:
+            logger.error(f"Error closing browser: {e}")
+        
+        # close() is best-effort, so make sure no Chromium processes outlive the run
+        if self.watchdog is not None:
+            try:
+                if self.watchdog.browser_processes():
+                    killed = await asyncio.to_thread(self.watchdog.kill_browsers)
+                    logger.warning(f"Killed {killed} browser processes left after close")
+            except Exception as e:
+                logger.error(f"Error killing leftover browser processes: {e}")
 
-async def browse_website(instruction, model="gpt-4o", headless=False, max_steps=50, use_vision=True, generate_gif=False, browser_size="mobile", initial_url=None):
+async def browse_website(instruction, model="gpt-4o", headless=False, max_steps=50, use_vision=True, generate_gif=False, browser_size="mobile", initial_url=None, dom_cache=True, watchdog=None, on_event=None, on_step=None):
     """
     Convenience function to browse a website using the autonomous browser agent.
     
@@ -238,12 +480,16 @@ async def browse_website(instruction, model="gpt-4o", headless=False, max_steps=
         generate_gif (bool): Whether to generate a GIF of the browsing session
         browser_size (str): Size of the browser window ('mobile', 'tablet', or 'pc')
         initial_url (str): Optional starting URL for the browser to navigate to
+        dom_cache (bool): Whether to reuse DOM extractions while the page is unchanged
+        watchdog (ResourceWatchdog): Optional watchdog that monitors and recycles the browser during the run
+        on_event (callable): Optional callback receiving (message, details) for structured run events
+        on_step (callable): Optional callback receiving the step number before each agent step
         
     Returns:
         str: The result of the browsing session
     """
     logger.info(f"browse_website called with instruction: {instruction}")
-    logger.info(f"Parameters: model={model}, headless={headless}, max_steps={max_steps}, use_vision={use_vision}, generate_gif={generate_gif}, browser_size={browser_size}, initial_url={initial_url}")
+    logger.info(f"Parameters: model={model}, headless={headless}, max_steps={max_steps}, use_vision={use_vision}, generate_gif={generate_gif}, browser_size={browser_size}, initial_url={initial_url}, dom_cache={dom_cache}")
     
     # Enhance the instruction with a default URL if one isn't specified in the instruction and initial_url is provided
     if initial_url and "http" not in instruction.lower():
@@ -277,7 +523,11 @@ async def browse_website(instruction, model="gpt-4o", headless=False, max_steps=
             max_steps=max_steps,
             use_vision=use_vision,
             generate_gif=generate_gif,
-            browser_size=browser_size
+            browser_size=browser_size,
+            dom_cache=dom_cache,
+            watchdog=watchdog,
+            on_event=on_event,
+            on_step=on_step
         )
         logger.info("AutonomousBrowserAgent instance created successfully")
     except Exception as e:
@@ -343,6 +593,12 @@ def browse_website_cli():
         help="Size of the browser window (default: mobile)"
     )
     
+    parser.add_argument(
+        "--no-dom-cache",
+        action="store_true",
+        help="Re-extract the page DOM on every step instead of reusing unchanged extractions"
+    )
+    
     parser.add_argument(
         "--interactive", 
         action="store_true", 
@@ -388,7 +644,8 @@ def browse_website_cli():
         headless=args.headless,
         max_steps=args.max_steps,
         generate_gif=args.generate_gif,
-        browser_size=args.browser_size
+        browser_size=args.browser_size,
+        dom_cache=not args.no_dom_cache
     ))
     
     print("\n" + "="*80)
@@ -0,0 +1,329 @@
+"""
+DOM extraction cache
+
+browser-use re-runs its DOM/clickable-element extraction on every agent step,
+even when the previous action left the page untouched. This module provides a
+BrowserContext that reuses the last extraction while the page is unchanged,
+detected through a MutationObserver counter injected into each document.
+"""
+
+import dataclasses
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from browser_use.browser.context import BrowserContext, BrowserContextConfig
+from browser_use.browser.views import BrowserState
+
+logger = logging.getLogger(__name__)
+
+# Id of the overlay browser-use draws its element highlights into
+HIGHLIGHT_CONTAINER_ID = "playwright-highlight-container"
+
+# Installs the mutation counter on first use in each document and returns the
+# current fingerprint. Mutations caused by browser-use's own highlighting are
+# ignored, and focus/hover/load/element-scroll events count as changes because
+# they can alter element visibility without touching the DOM. Window scrolling
+# is part of the key instead. Shadow roots are picked up when their host is
+# added; the page's own prototypes are left untouched.
+DOM_FINGERPRINT_JS = """
+async () => {
+    const HIGHLIGHT_ID = '%(highlight_id)s';
+    let state = window.__browserAgentDomFingerprint;
+    if (!state) {
+        state = {
+            id: `${performance.timeOrigin}-${Math.random().toString(36).slice(2)}`,
+            mutations: 0,
+        };
+        const isHighlight = (node) => {
+            if (!node) return false;
+            const element = node.nodeType === Node.ELEMENT_NODE ? node : node.parentElement;
+            return !!(element && element.closest && element.closest('#' + HIGHLIGHT_ID));
+        };
+        const isRelevant = (record) => {
+            if (record.type === 'attributes' && (record.attributeName || '').startsWith('browser-user-highlight')) {
+                return false;
+            }
+            if (isHighlight(record.target)) return false;
+            if (record.type === 'childList') {
+                const nodes = [...record.addedNodes, ...record.removedNodes];
+                if (nodes.length && nodes.every(isHighlight)) return false;
+            }
+            return true;
+        };
+        const observed = new WeakSet();
+        let observer;
+        const observeShadowRoots = (element) => {
+            for (const node of [element, ...element.querySelectorAll('*')]) {
+                const root = node.shadowRoot;
+                if (root && !observed.has(root)) {
+                    observed.add(root);
+                    observer.observe(root, {
+                        subtree: true, childList: true, attributes: true, characterData: true,
+                    });
+                    state.mutations++;
+                    observeShadowRoots(root);
+                }
+            }
+        };
+        const count = (records) => {
+            for (const record of records) {
+                if (!isRelevant(record)) continue;
+                state.mutations++;
+                for (const node of record.addedNodes || []) {
+                    if (node.nodeType === Node.ELEMENT_NODE) observeShadowRoots(node);
+                }
+            }
+        };
+        observer = new MutationObserver(count);
+        observer.observe(document, {
+            subtree: true, childList: true, attributes: true, characterData: true,
+        });
+        observeShadowRoots(document.documentElement);
+
+        const bump = (event) => {
+            // Window scrolling is part of the key; only element scrolls count here
+            if (event.type === 'scroll' && (event.target === document || event.target === window)) return;
+            if (!isHighlight(event.target)) state.mutations++;
+        };
+        for (const type of ['focusin', 'focusout', 'input', 'change', 'mouseover', 'mouseout', 'scroll',
+                            'transitionend', 'animationend', 'load', 'error']) {
+            document.addEventListener(type, bump, true);
+        }
+
+        state.flush = () => count(observer.takeRecords());
+        Object.defineProperty(window, '__browserAgentDomFingerprint', { value: state });
+    }
+    // Scroll events are only dispatched on the next rendering update
+    await new Promise((resolve) => {
+        requestAnimationFrame(() => resolve());
+        setTimeout(resolve, 100);
+    });
+    state.flush();
+    return {
+        document: state.id,
+        mutations: state.mutations,
+        cacheable: window.frames.length === 0,
+        scrollX: window.scrollX,
+        scrollY: window.scrollY,
+        width: window.innerWidth,
+        height: window.innerHeight,
+    };
+}
+""" % {"highlight_id": HIGHLIGHT_CONTAINER_ID}
+
+# Detaches the highlight overlay instead of dropping it, so a cache hit can put
+# back exactly what a fresh extraction would have drawn.
+STASH_HIGHLIGHTS_JS = """
+() => {
+    const container = document.getElementById('%(highlight_id)s');
+    if (container) {
+        window.__browserAgentHighlightStash = container;
+        container.remove();
+    }
+}
+""" % {"highlight_id": HIGHLIGHT_CONTAINER_ID}
+
+RESTORE_HIGHLIGHTS_JS = """
+() => {
+    const container = window.__browserAgentHighlightStash;
+    if (container && !container.isConnected && document.body) {
+        document.body.appendChild(container);
+    }
+}
+"""
+
+DROP_HIGHLIGHTS_JS = """
+() => { window.__browserAgentHighlightStash = null; }
+"""
+
+
+@dataclasses.dataclass
+class DomCacheStats:
+    """Counters describing how well the DOM extraction cache performed."""
+
+    hits: int = 0
+    misses: int = 0
+    bypassed: int = 0
+    extraction_seconds: float = 0.0
+    saved_seconds: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses + self.bypassed
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hit_rate, 3),
+            "extraction_seconds": round(self.extraction_seconds, 3),
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
+
+
+@dataclasses.dataclass
+class _CacheEntry:
+    state: BrowserState
+    extraction_seconds: float
+
+
+class DomExtractionCache:
+    """
+    Small LRU of processed page states keyed by page fingerprint.
+
+    Every document gets a fresh fingerprint id, so old entries are never hit
+    again after navigation and simply age out.
+    """
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self.stats = DomCacheStats()
+        self._entries = OrderedDict()
+
+    def get(self, key: tuple) -> Optional[_CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: tuple, state: BrowserState, extraction_seconds: float):
+        self._entries[key] = _CacheEntry(state=state, extraction_seconds=extraction_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class CachingBrowserContext(BrowserContext):
+    """
+    BrowserContext that skips DOM extraction when the page has not changed.
+
+    The cache key is the page URL plus a fingerprint of the current document:
+    its mutation counter, scroll position and viewport size. Pages containing
+    frames are always extracted, since mutations inside them are not observed.
+    """
+
+    def __init__(
+        self,
+        browser,
+        config: Optional[BrowserContextConfig] = None,
+        max_entries: int = 16,
+        enabled: bool = True
+    ):
+        """
+        Initialize the caching browser context.
+
+        Args:
+            browser (Browser): The browser-use Browser that owns this context
+            config (BrowserContextConfig): Context configuration (default: BrowserContextConfig())
+            max_entries (int): Maximum number of page states kept in the cache
+            enabled (bool): Whether to cache at all; when False every step is extracted
+        """
+        super().__init__(browser=browser, config=config or BrowserContextConfig())
+        self.dom_cache = DomExtractionCache(max_entries=max_entries)
+        self.enabled = enabled
+        self._stash_highlights = enabled
+
+    @property
+    def dom_cache_stats(self) -> DomCacheStats:
+        return self.dom_cache.stats
+
+    async def _page_fingerprint(self, focus_element: int) -> Optional[tuple]:
+        """Return the cache key for the current page, or None if it can't be cached."""
+        try:
+            page = await self.get_current_page()
+            fingerprint = await page.evaluate(DOM_FINGERPRINT_JS)
+        except Exception as e:
+            logger.debug(f"Could not fingerprint page, skipping DOM cache: {str(e)}")
+            return None
+        if not fingerprint or not fingerprint.get("cacheable"):
+            return None
+        return (
+            page.url,
+            fingerprint["document"],
+            fingerprint["mutations"],
+            fingerprint["scrollX"],
+            fingerprint["scrollY"],
+            fingerprint["width"],
+            fingerprint["height"],
+            focus_element,
+        )
+
+    async def remove_highlights(self):
+        """Detach the highlight overlay so a later cache hit can restore it."""
+        if self._stash_highlights:
+            try:
+                page = await self.get_current_page()
+                await page.evaluate(STASH_HIGHLIGHTS_JS)
+            except Exception as e:
+                logger.debug(f"Could not stash highlights: {str(e)}")
+        await super().remove_highlights()
+
+    async def _reuse_state(self, entry: _CacheEntry) -> BrowserState:
+        """Build a fresh BrowserState around a cached DOM extraction."""
+        page = await self.get_current_page()
+        if self.config.highlight_elements:
+            await page.evaluate(RESTORE_HIGHLIGHTS_JS)
+        state = dataclasses.replace(
+            entry.state,
+            url=page.url,
+            title=await page.title(),
+            tabs=await self.get_tabs_info(),
+            screenshot=await self.take_screenshot(),
+        )
+        self.current_state = state
+        return state
+
+    async def _update_state(self, focus_element: int = -1) -> BrowserState:
+        if not self.enabled:
+            return await super()._update_state(focus_element)
+
+        stats = self.dom_cache.stats
+        start = time.perf_counter()
+        key = await self._page_fingerprint(focus_element)
+
+        if key is not None:
+            entry = self.dom_cache.get(key)
+            if entry is not None:
+                try:
+                    state = await self._reuse_state(entry)
+                except Exception as e:
+                    logger.debug(f"Could not reuse cached DOM state, extracting again: {str(e)}")
+                else:
+                    elapsed = time.perf_counter() - start
+                    stats.hits += 1
+                    stats.saved_seconds += max(entry.extraction_seconds - elapsed, 0.0)
+                    logger.debug(f"DOM cache hit for {key[0]} ({elapsed:.3f}s)")
+                    return state
+
+        previous_state = getattr(self, "current_state", None)
+        try:
+            page = await self.get_current_page()
+            await page.evaluate(DROP_HIGHLIGHTS_JS)
+        except Exception:
+            pass
+
+        # A real extraction must really remove the previous highlights first
+        self._stash_highlights = False
+        try:
+            state = await super()._update_state(focus_element)
+        finally:
+            self._stash_highlights = self.enabled
+        elapsed = time.perf_counter() - start
+        stats.extraction_seconds += elapsed
+
+        # browser-use falls back to the previous state when extraction fails;
+        # that must not be stored under the new fingerprint.
+        if key is None or state is previous_state:
+            stats.bypassed += 1
+        else:
+            stats.misses += 1
+            self.dom_cache.put(key, state, elapsed)
+            logger.debug(f"DOM cache miss for {key[0]} ({elapsed:.3f}s)")
+        return state
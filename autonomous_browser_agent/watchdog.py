@@ -0,0 +1,390 @@
+"""
+Process and memory watchdog
+
+Samples the RSS and CPU usage of the current Python process and of one
+agent's Chromium process tree, recycles or kills that browser when it stays
+over the configured limits, and cleans up Chromium trees left behind by
+crashed runs.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Callable, List, Optional
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# Process names used by Chromium builds that Playwright launches
+CHROMIUM_PROCESS_NAMES = ("chrome", "chromium", "headless_shell", "chrome-headless-shell")
+
+# Set in the worker environment so every browser it launches records its owner
+OWNER_ENV_VAR = "AUTONOMOUS_BROWSER_AGENT_OWNER"
+
+# Chromium ignores switches it doesn't know, so this marks a watchdog's browser
+RUN_MARKER_FLAG = "--autonomous-browser-agent-run"
+
+MB = 1024 * 1024
+
+
+def _is_chromium(proc: psutil.Process) -> bool:
+    try:
+        name = proc.name().lower()
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+    return any(chromium_name in name for chromium_name in CHROMIUM_PROCESS_NAMES)
+
+
+def _is_playwright_browser(proc: psutil.Process) -> bool:
+    """Whether proc is the main process of a Playwright-launched Chromium."""
+    if not _is_chromium(proc):
+        return False
+    try:
+        cmdline = proc.cmdline()
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+    # Renderer, GPU and utility processes all carry a --type flag
+    if any(arg.startswith("--type=") for arg in cmdline):
+        return False
+    return "--remote-debugging-pipe" in cmdline
+
+
+def _owner_tag(proc: psutil.Process) -> str:
+    # The create time guards against the owner's pid being reused
+    return f"{proc.pid}:{proc.create_time()}"
+
+
+def tag_browser_owner():
+    """
+    Mark browsers launched from this process with its pid and start time.
+
+    Playwright passes the environment down to Chromium, which is what lets
+    cleanup_orphaned_browsers() tell whether a browser's owner is still alive.
+    Must be called before the browser is launched.
+    """
+    os.environ[OWNER_ENV_VAR] = _owner_tag(psutil.Process())
+
+
+def _is_orphaned(proc: psutil.Process) -> bool:
+    """
+    Whether a browser was launched by an agent process that no longer exists.
+
+    Browsers without an owner tag belong to someone else and are never orphans.
+    """
+    try:
+        tag = proc.environ().get(OWNER_ENV_VAR)
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+    if not tag:
+        return False
+    pid, _, create_time = tag.partition(":")
+    try:
+        owner = psutil.Process(int(pid))
+        return str(owner.create_time()) != create_time
+    except psutil.NoSuchProcess:
+        return True
+    except (ValueError, psutil.AccessDenied):
+        return False
+
+
+def kill_process_tree(proc: psutil.Process, timeout: float = 5.0) -> int:
+    """
+    Terminate a process and all of its descendants, killing any that linger.
+
+    Returns:
+        int: The number of processes that were signalled
+    """
+    try:
+        procs = proc.children(recursive=True) + [proc]
+    except psutil.NoSuchProcess:
+        return 0
+    for p in procs:
+        try:
+            p.terminate()
+        except psutil.NoSuchProcess:
+            pass
+    _, alive = psutil.wait_procs(procs, timeout=timeout)
+    for p in alive:
+        try:
+            p.kill()
+        except psutil.NoSuchProcess:
+            pass
+    return len(procs)
+
+
+def cleanup_orphaned_browsers() -> int:
+    """
+    Kill Chromium trees whose launching agent process has died.
+
+    Only browsers tagged by tag_browser_owner() and owned by the current user
+    are considered. Meant to be called once at worker startup.
+
+    Returns:
+        int: The number of orphaned browser trees that were killed
+    """
+    try:
+        username = psutil.Process().username()
+    except psutil.Error:
+        username = None
+
+    killed = 0
+    for proc in psutil.process_iter(["username"]):
+        if username and proc.info.get("username") != username:
+            continue
+        if not _is_playwright_browser(proc) or not _is_orphaned(proc):
+            continue
+        logger.warning(f"Killing orphaned browser process tree rooted at pid {proc.pid}")
+        try:
+            kill_process_tree(proc)
+            killed += 1
+        except psutil.Error as e:
+            logger.error(f"Error killing orphaned browser {proc.pid}: {str(e)}")
+    return killed
+
+
+class ResourceWatchdog:
+    """
+    Periodically samples resource usage of this process and its browsers.
+
+    Only the browser launched with ``browser_args()`` is watched, so several
+    agents can share a process, each with its own watchdog. The Python figures
+    cover the whole process.
+
+    Every sample is passed to ``on_event`` as a ``resource_usage`` event. When the
+    Chromium process tree stays over ``max_browser_rss_mb`` or
+    ``max_browser_cpu_percent`` for ``breach_samples`` consecutive samples, a
+    recycle is requested. The agent picks the request up with
+    ``take_recycle_request()`` at its next step boundary, so the browser is
+    never closed under a running step. Once ``max_recycles`` is used up, or a
+    request is not picked up within ``recycle_timeout``, the Chromium processes
+    are killed and the ``on_kill`` callback given to ``start()`` is notified.
+    """
+
+    def __init__(
+        self,
+        interval: float = 10.0,
+        max_browser_rss_mb: Optional[float] = None,
+        max_browser_cpu_percent: Optional[float] = None,
+        breach_samples: int = 2,
+        max_recycles: int = 2,
+        recycle_timeout: float = 60.0,
+        on_event: Optional[Callable[[str, dict], None]] = None
+    ):
+        """
+        Initialize the watchdog.
+
+        Args:
+            interval (float): Seconds between samples
+            max_browser_rss_mb (float): Chromium process-tree RSS limit in MB (default: no limit)
+            max_browser_cpu_percent (float): Chromium process-tree CPU limit in percent of one core (default: no limit)
+            breach_samples (int): Consecutive samples over a limit before acting
+            max_recycles (int): Browser recycles allowed before falling back to killing it
+            recycle_timeout (float): Seconds to wait for a requested recycle before killing the browser
+            on_event (callable): Called with (message, details) for every sample and action
+        """
+        self.interval = interval
+        self.max_browser_rss_mb = max_browser_rss_mb
+        self.max_browser_cpu_percent = max_browser_cpu_percent
+        self.breach_samples = breach_samples
+        self.max_recycles = max_recycles
+        self.recycle_timeout = recycle_timeout
+        self.on_event = on_event
+
+        self.run_id = uuid.uuid4().hex
+        self.recycles = 0
+        self.kills = 0
+        self.last_sample = None
+        self.recycle_requested = None
+        self._recycle_requested_at = None
+        self._process = psutil.Process(os.getpid())
+        self._tracked = {}
+        self._breaches = 0
+        self._task = None
+        self._on_kill = None
+
+    def _emit(self, message: str, details: dict):
+        if self.on_event is None:
+            return
+        try:
+            self.on_event(message, details)
+        except Exception as e:
+            logger.error(f"Error in watchdog event handler: {str(e)}")
+
+    def _tracked_process(self, proc: psutil.Process) -> psutil.Process:
+        # cpu_percent() measures against the previous call on the same object
+        tracked = self._tracked.get(proc.pid)
+        if tracked is None:
+            tracked = proc
+            self._tracked[proc.pid] = tracked
+            tracked.cpu_percent(None)
+        return tracked
+
+    def browser_args(self) -> List[str]:
+        """
+        Chromium arguments that mark a browser as the one this watchdog watches.
+
+        Pass them in ``BrowserConfig.extra_chromium_args``; they survive recycles
+        because browser-use relaunches with the same config.
+        """
+        return [f"{RUN_MARKER_FLAG}={self.run_id}"]
+
+    def _is_own_browser(self, proc: psutil.Process) -> bool:
+        if not _is_playwright_browser(proc):
+            return False
+        try:
+            return f"{RUN_MARKER_FLAG}={self.run_id}" in proc.cmdline()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return False
+
+    def _own_browsers(self) -> List[psutil.Process]:
+        """Return the main processes of the browsers launched with browser_args()."""
+        try:
+            children = self._process.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return []
+        return [proc for proc in children if self._is_own_browser(proc)]
+
+    def browser_processes(self) -> List[psutil.Process]:
+        """Return every Chromium process in this watchdog's browser trees."""
+        procs = {}
+        for browser in self._own_browsers():
+            procs[browser.pid] = browser
+            try:
+                children = browser.children(recursive=True)
+            except psutil.NoSuchProcess:
+                continue
+            for proc in children:
+                if _is_chromium(proc):
+                    procs[proc.pid] = proc
+        return list(procs.values())
+
+    def sample(self) -> dict:
+        """Take a single resource usage sample."""
+        python = self._tracked_process(self._process)
+        browsers = [self._tracked_process(proc) for proc in self.browser_processes()]
+
+        browser_rss = 0
+        browser_cpu = 0.0
+        alive = {python.pid}
+        for proc in browsers:
+            try:
+                browser_rss += proc.memory_info().rss
+                browser_cpu += proc.cpu_percent(None)
+                alive.add(proc.pid)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        self._tracked = {pid: proc for pid, proc in self._tracked.items() if pid in alive}
+
+        self.last_sample = {
+            "python_rss_mb": round(python.memory_info().rss / MB, 1),
+            "python_cpu_percent": round(python.cpu_percent(None), 1),
+            "browser_rss_mb": round(browser_rss / MB, 1),
+            "browser_cpu_percent": round(browser_cpu, 1),
+            "browser_processes": len(alive) - 1,
+            "recycles": self.recycles,
+            "kills": self.kills,
+        }
+        return self.last_sample
+
+    def _over_limits(self, sample: dict) -> List[str]:
+        reasons = []
+        if self.max_browser_rss_mb is not None and sample["browser_rss_mb"] > self.max_browser_rss_mb:
+            reasons.append(f"browser RSS {sample['browser_rss_mb']}MB > {self.max_browser_rss_mb}MB")
+        if self.max_browser_cpu_percent is not None and sample["browser_cpu_percent"] > self.max_browser_cpu_percent:
+            reasons.append(f"browser CPU {sample['browser_cpu_percent']}% > {self.max_browser_cpu_percent}%")
+        return reasons
+
+    def kill_browsers(self) -> int:
+        """Kill this watchdog's browser process trees."""
+        killed = 0
+        for proc in self._own_browsers():
+            try:
+                killed += kill_process_tree(proc)
+            except psutil.Error:
+                continue
+        return killed
+
+    def take_recycle_request(self) -> Optional[str]:
+        """
+        Claim a pending recycle request.
+
+        Returns:
+            str: The reason the recycle was requested, or None if there is none
+        """
+        reason = self.recycle_requested
+        self.recycle_requested = None
+        self._recycle_requested_at = None
+        return reason
+
+    async def _enforce_limits(self, sample: dict):
+        if self.kills:
+            return
+        reasons = self._over_limits(sample)
+        if not reasons:
+            self._breaches = 0
+            return
+        self._breaches += 1
+        if self._breaches < self.breach_samples:
+            return
+        self._breaches = 0
+        reason = ", ".join(reasons)
+
+        if self.recycle_requested is not None:
+            if time.monotonic() - self._recycle_requested_at < self.recycle_timeout:
+                return
+            logger.error(f"Browser recycle was not picked up within {self.recycle_timeout}s, killing browser instead")
+        elif self.recycles < self.max_recycles:
+            self.recycles += 1
+            self.recycle_requested = reason
+            self._recycle_requested_at = time.monotonic()
+            logger.warning(f"Requesting browser recycle ({self.recycles}/{self.max_recycles}): {reason}")
+            self._emit("Recycling browser", {"event": "browser_recycle", "reason": reason, **sample})
+            return
+
+        self.kills += 1
+        self.take_recycle_request()
+        killed = await asyncio.to_thread(self.kill_browsers)
+        logger.warning(f"Killed {killed} browser processes: {reason}")
+        self._emit("Killed browser", {"event": "browser_kill", "reason": reason, "killed_processes": killed, **sample})
+        if self._on_kill is not None:
+            self._on_kill(reason)
+
+    async def _watch(self):
+        while True:
+            started = time.monotonic()
+            try:
+                sample = await asyncio.to_thread(self.sample)
+                self._emit("Resource usage", {"event": "resource_usage", **sample})
+                await self._enforce_limits(sample)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in resource watchdog: {str(e)}")
+            await asyncio.sleep(max(self.interval - (time.monotonic() - started), 0))
+
+    def start(self, on_kill: Optional[Callable[[str], None]] = None):
+        """
+        Start sampling in the background on the running event loop.
+
+        Args:
+            on_kill (callable): Called with the reason after the browser has been killed
+        """
+        if self._task is not None:
+            return
+        self._on_kill = on_kill
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        """Stop sampling."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._on_kill = None
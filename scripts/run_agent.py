@@ -25,7 +25,7 @@ print(f"Adding to Python path: {parent_dir}")
 print(f"Python path: {sys.path}")
 
 try:
-    from autonomous_browser_agent import browse_website
+    from autonomous_browser_agent import browse_website, ResourceWatchdog, cleanup_orphaned_browsers, tag_browser_owner
     print("Successfully imported autonomous_browser_agent")
 except ImportError as e:
     print(f"Error: Could not import autonomous_browser_agent. Make sure it's installed. Error: {e}")
@@ -104,6 +104,37 @@ class AgentLogger:
             details["stack_trace"] = stack_trace
         self.log_event("running", error_message, details, level="error")
 
+def env_float(name, default=None):
+    """Read an optional float setting from the environment."""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Invalid value for {name}: {value}. Using default {default}.")
+        return default
+
+# Agent events that are logged as warnings in the NestJS backend
+WARNING_EVENTS = {"browser_recycle", "browser_recycled", "browser_recycle_failed", "browser_kill", "orphan_cleanup"}
+
+def log_agent_event(agent_logger, message, details):
+    """Log an event reported by the agent or its watchdog against the current step."""
+    level = "warning" if details.get("event") in WARNING_EVENTS else "info"
+    agent_logger.log_event("running", message, details, agent_logger.current_step, level=level)
+
+def create_watchdog(agent_logger):
+    """Create a resource watchdog configured from WATCHDOG_* environment variables."""
+    if os.getenv("WATCHDOG_ENABLED", "true").lower() == "false":
+        return None
+    return ResourceWatchdog(
+        interval=env_float("WATCHDOG_INTERVAL", 10.0),
+        max_browser_rss_mb=env_float("WATCHDOG_MAX_BROWSER_RSS_MB"),
+        max_browser_cpu_percent=env_float("WATCHDOG_MAX_BROWSER_CPU_PERCENT"),
+        max_recycles=int(env_float("WATCHDOG_MAX_RECYCLES", 2)),
+        on_event=lambda message, details: log_agent_event(agent_logger, message, details)
+    )
+
 async def run_agent():
     """Run the autonomous browser agent with the provided configuration."""
     if len(sys.argv) < 9:
@@ -141,6 +172,20 @@ async def run_agent():
     # Create agent logger
     agent_logger = AgentLogger()
     
+    # Kill browsers left behind by agent processes that crashed or were killed
+    try:
+        orphaned = cleanup_orphaned_browsers()
+        if orphaned:
+            agent_logger.log_event("running", f"Cleaned up {orphaned} orphaned browser process trees", {
+                "event": "orphan_cleanup",
+                "killed": orphaned
+            }, agent_logger.current_step, level="warning")
+    except Exception as e:
+        logger.error(f"Error cleaning up orphaned browsers: {str(e)}")
+    
+    # Let a future worker recognise browsers this one leaves behind
+    tag_browser_owner()
+    
     # Log initial agent parameters
     agent_logger.log_event("running", "Agent started", {
         "event": "agent_start",
@@ -165,7 +210,10 @@ async def run_agent():
             max_steps=max_steps,
             use_vision=use_vision,
             generate_gif=generate_gif,
-            browser_size=browser_size
+            browser_size=browser_size,
+            watchdog=create_watchdog(agent_logger),
+            on_event=lambda message, details: log_agent_event(agent_logger, message, details),
+            on_step=agent_logger.update_step
         )
         
         # Process the result - handle both string and dictionary results
@@ -469,10 +469,10 @@ if __name__ == "__main__":
           const eventType = processedMessage.details?.event || 'step';
           let logLevel = 'info';
           
-          // Adjust log level based on event type
-          if (eventType === 'error') {
+          // Adjust log level based on event type, or the level the script reported
+          if (eventType === 'error' || processedMessage.level === 'error') {
             logLevel = 'error';
-          } else if (eventType === 'warning') {
+          } else if (eventType === 'warning' || processedMessage.level === 'warning') {
             logLevel = 'warn';
           }
           
@@ -0,0 +1,133 @@
+"""
+Parity checks for the DOM extraction cache.
+
+Each scenario loads a local fixture, takes a state, then performs a series of
+actions with a state taken after each one. It runs once through
+CachingBrowserContext and once through a plain browser-use BrowserContext, and
+the final extractions must be identical.
+"""
+
+import asyncio
+import os
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "false")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+pytest.importorskip("browser_use")
+
+from browser_use import Browser, BrowserConfig, BrowserContextConfig
+from browser_use.browser.context import BrowserContext
+
+from autonomous_browser_agent.dom_cache import CachingBrowserContext
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+async def noop(page):
+    pass
+
+
+async def type_name(page):
+    await page.fill("#name", "Ada")
+
+
+async def scroll_down(page):
+    await page.evaluate("window.scrollTo(0, 1200)")
+
+
+async def scroll_down_and_back(page):
+    await page.evaluate("window.scrollTo(0, 1200)")
+    await page.evaluate("window.scrollTo(0, 0)")
+
+
+async def scroll_results(page):
+    await page.evaluate("document.getElementById('results').scrollTop = 400")
+
+
+async def add_shadow_button(page):
+    await page.evaluate("""
+        () => {
+            const root = document.querySelectorAll('fancy-card')[0].shadowRoot;
+            const button = document.createElement('button');
+            button.textContent = 'Added';
+            root.getElementById('slot').appendChild(button);
+        }
+    """)
+
+
+async def add_shadow_host(page):
+    await page.evaluate("document.body.appendChild(document.createElement('fancy-card'))")
+
+
+async def add_button_to_new_host(page):
+    await page.evaluate("""
+        () => {
+            const root = document.querySelectorAll('fancy-card')[1].shadowRoot;
+            const button = document.createElement('button');
+            button.textContent = 'Added later';
+            root.getElementById('slot').appendChild(button);
+        }
+    """)
+
+
+def snapshot(state):
+    return state.element_tree.clickable_elements_to_string(), sorted(state.selector_map.keys())
+
+
+async def run_scenario(context, fixture, actions):
+    page = await context.get_current_page()
+    await page.goto((FIXTURES / fixture).as_uri())
+    await page.wait_for_load_state()
+    state = await context.get_state()
+    for action in actions:
+        await action(page)
+        state = await context.get_state()
+    return snapshot(state)
+
+
+async def compare(fixture, actions):
+    browser = Browser(config=BrowserConfig(headless=True))
+    try:
+        try:
+            await browser.get_playwright_browser()
+        except Exception as e:
+            pytest.skip(f"Chromium is not available: {e}")
+
+        config = BrowserContextConfig()
+        cached_context = CachingBrowserContext(browser=browser, config=config)
+        plain_context = BrowserContext(browser=browser, config=config)
+        try:
+            cached = await run_scenario(cached_context, fixture, actions)
+            plain = await run_scenario(plain_context, fixture, actions)
+        finally:
+            await cached_context.close()
+            await plain_context.close()
+        return cached, plain, cached_context.dom_cache_stats
+    finally:
+        await browser.close()
+
+
+@pytest.mark.parametrize(
+    "fixture, actions, hits",
+    [
+        ("form.html", [noop], 1),
+        ("form.html", [type_name], 0),
+        ("form.html", [scroll_down], 0),
+        ("form.html", [scroll_down_and_back], 1),
+        ("form.html", [scroll_results], 0),
+        ("form.html", [scroll_results, noop], 1),
+        ("shadow.html", [noop], 1),
+        ("shadow.html", [add_shadow_button], 0),
+        ("shadow.html", [add_shadow_host, noop], 1),
+        ("shadow.html", [add_shadow_host, add_button_to_new_host], 0),
+    ],
+)
+def test_cached_extraction_matches_uncached(fixture, actions, hits):
+    cached, plain, stats = asyncio.run(compare(fixture, actions))
+
+    assert cached == plain
+    assert stats.hits == hits
+    assert stats.misses == len(actions) + 1 - hits
@@ -0,0 +1,217 @@
+"""
+Tests for the resource watchdog's limit enforcement, browser scoping, orphan
+detection and the run_agent.py settings it is configured from.
+
+No browser is launched: samples, processes and kills are all faked.
+"""
+
+import asyncio
+import importlib.util
+import sys
+from pathlib import Path
+
+import psutil
+import pytest
+
+from autonomous_browser_agent import watchdog as watchdog_module
+from autonomous_browser_agent.watchdog import OWNER_ENV_VAR, ResourceWatchdog, _is_orphaned
+
+OVER = {"browser_rss_mb": 900.0, "browser_cpu_percent": 10.0}
+UNDER = {"browser_rss_mb": 100.0, "browser_cpu_percent": 10.0}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeProcess:
+    def __init__(self, pid, name="chrome", cmdline=(), children=(), environ=None):
+        self.pid = pid
+        self._name = name
+        self._cmdline = list(cmdline)
+        self._children = list(children)
+        self._environ = environ or {}
+
+    def name(self):
+        return self._name
+
+    def cmdline(self):
+        return self._cmdline
+
+    def children(self, recursive=False):
+        if not recursive:
+            return list(self._children)
+        procs = []
+        for child in self._children:
+            procs.append(child)
+            procs.extend(child.children(recursive=True))
+        return procs
+
+    def environ(self):
+        return self._environ
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(watchdog_module.time, "monotonic", clock)
+    return clock
+
+
+def make_watchdog(monkeypatch, **kwargs):
+    kwargs.setdefault("max_browser_rss_mb", 500)
+    kwargs.setdefault("breach_samples", 2)
+    kwargs.setdefault("max_recycles", 1)
+    kwargs.setdefault("recycle_timeout", 60)
+    events = []
+    watchdog = ResourceWatchdog(on_event=lambda message, details: events.append(details["event"]), **kwargs)
+    kills = []
+    monkeypatch.setattr(watchdog, "kill_browsers", lambda: kills.append(True) or 3)
+    return watchdog, events, kills
+
+
+def enforce(watchdog, *samples):
+    async def run():
+        for sample in samples:
+            await watchdog._enforce_limits(sample)
+    asyncio.run(run())
+
+
+def test_breaches_must_be_consecutive(monkeypatch, clock):
+    watchdog, events, kills = make_watchdog(monkeypatch)
+
+    enforce(watchdog, OVER, UNDER, OVER)
+
+    assert watchdog.recycle_requested is None
+    assert events == []
+
+
+def test_sustained_breach_requests_recycle(monkeypatch, clock):
+    watchdog, events, kills = make_watchdog(monkeypatch)
+
+    enforce(watchdog, OVER, OVER)
+
+    assert "browser RSS 900.0MB > 500MB" in watchdog.recycle_requested
+    assert watchdog.recycles == 1
+    assert events == ["browser_recycle"]
+    assert kills == []
+
+
+def test_unclaimed_recycle_is_killed_after_timeout(monkeypatch, clock):
+    watchdog, events, kills = make_watchdog(monkeypatch, max_recycles=2)
+    killed = []
+    watchdog._on_kill = killed.append
+
+    enforce(watchdog, OVER, OVER)
+    clock.now += 30
+    enforce(watchdog, OVER, OVER)
+    assert kills == []
+
+    clock.now += 31
+    enforce(watchdog, OVER, OVER)
+
+    assert kills == [True]
+    assert watchdog.kills == 1
+    assert watchdog.recycles == 1
+    assert watchdog.recycle_requested is None
+    assert events == ["browser_recycle", "browser_kill"]
+    assert len(killed) == 1
+
+
+def test_kills_once_recycles_are_used_up(monkeypatch, clock):
+    watchdog, events, kills = make_watchdog(monkeypatch, max_recycles=1)
+    killed = []
+    watchdog._on_kill = killed.append
+
+    enforce(watchdog, OVER, OVER)
+    assert watchdog.take_recycle_request() is not None
+    enforce(watchdog, OVER, OVER)
+
+    assert kills == [True]
+    assert events == ["browser_recycle", "browser_kill"]
+    assert killed == ["browser RSS 900.0MB > 500MB"]
+
+    # Nothing more happens once the browser has been killed
+    enforce(watchdog, OVER, OVER)
+    assert kills == [True]
+    assert watchdog.kills == 1
+
+
+def test_take_recycle_request_claims_it_once(monkeypatch, clock):
+    watchdog, events, kills = make_watchdog(monkeypatch)
+    assert watchdog.take_recycle_request() is None
+
+    enforce(watchdog, OVER, OVER)
+    reason = watchdog.take_recycle_request()
+
+    assert reason.startswith("browser RSS")
+    assert watchdog.take_recycle_request() is None
+    assert watchdog._recycle_requested_at is None
+
+
+def test_only_own_browser_tree_is_watched():
+    watchdog = ResourceWatchdog()
+    renderer = FakeProcess(11, cmdline=["chrome", "--type=renderer"])
+    own = FakeProcess(10, cmdline=["chrome", "--remote-debugging-pipe", *watchdog.browser_args()], children=[renderer])
+    other = FakeProcess(20, cmdline=["chrome", "--remote-debugging-pipe", "--autonomous-browser-agent-run=other"],
+                        children=[FakeProcess(21, cmdline=["chrome", "--type=renderer"])])
+    driver = FakeProcess(5, name="node", children=[own, other])
+    watchdog._process = FakeProcess(1, name="python", children=[driver])
+
+    assert sorted(proc.pid for proc in watchdog.browser_processes()) == [10, 11]
+    assert [proc.pid for proc in watchdog._own_browsers()] == [10]
+
+
+def test_untagged_browser_is_not_orphaned():
+    assert not _is_orphaned(FakeProcess(10))
+
+
+def test_browser_of_live_owner_is_not_orphaned():
+    owner = psutil.Process()
+    tag = f"{owner.pid}:{owner.create_time()}"
+    assert not _is_orphaned(FakeProcess(10, environ={OWNER_ENV_VAR: tag}))
+
+
+def test_browser_of_dead_owner_is_orphaned(monkeypatch):
+    def dead(pid):
+        raise psutil.NoSuchProcess(pid)
+    monkeypatch.setattr(watchdog_module.psutil, "Process", dead)
+
+    assert _is_orphaned(FakeProcess(10, environ={OWNER_ENV_VAR: "4242:1700000000.0"}))
+
+
+def test_browser_of_reused_owner_pid_is_orphaned():
+    owner = psutil.Process()
+    tag = f"{owner.pid}:{owner.create_time() - 100}"
+    assert _is_orphaned(FakeProcess(10, environ={OWNER_ENV_VAR: tag}))
+
+
+@pytest.fixture
+def run_agent(monkeypatch, tmp_path):
+    # The script names its log file after argv[1] at import time
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "argv", ["run_agent.py", "test"])
+    path = Path(__file__).parent.parent / "scripts" / "run_agent.py"
+    spec = importlib.util.spec_from_file_location("run_agent", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_env_float(run_agent, monkeypatch):
+    monkeypatch.delenv("WATCHDOG_TEST_VALUE", raising=False)
+    assert run_agent.env_float("WATCHDOG_TEST_VALUE") is None
+    assert run_agent.env_float("WATCHDOG_TEST_VALUE", 5.0) == 5.0
+
+    monkeypatch.setenv("WATCHDOG_TEST_VALUE", "")
+    assert run_agent.env_float("WATCHDOG_TEST_VALUE", 5.0) == 5.0
+
+    monkeypatch.setenv("WATCHDOG_TEST_VALUE", "2.5")
+    assert run_agent.env_float("WATCHDOG_TEST_VALUE", 5.0) == 2.5
+
+    monkeypatch.setenv("WATCHDOG_TEST_VALUE", "lots")
+    assert run_agent.env_float("WATCHDOG_TEST_VALUE", 5.0) == 5.0